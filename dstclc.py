@@ -10,7 +10,9 @@
 #
 
 import os
-import itertools
+import mmap
+import hashlib
+import tempfile
 
 import numpy as np
 import scipy as sp
@@ -21,87 +23,378 @@ import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.preprocessing import FunctionTransformer
 from sklearn.metrics.pairwise import pairwise_distances as pdist
+from sklearn.metrics.pairwise import paired_distances
+from sklearn.utils.sparsefuncs import min_max_axis
 
-from util import njobs
+from util import njobs, cache
 
 
-def parallel_pairwise(X, Y, func, n_jobs=1, symmetric=False, min_chunksize=1, **kwargs):
-	from sklearn.metrics import pairwise
-	from sklearn.utils import gen_even_slices
-	# from sklearn.externals.joblib import Parallel
-	# from sklearn.externals.joblib import delayed
-	from sklearn.externals.joblib import cpu_count
-	import parmap
-	if n_jobs < 0:
-		n_jobs = max(cpu_count() + 1 + n_jobs, 1)
+def _pairwise_tile(func, X, Y, slc, fpath, offset, dtype, shape, kwargs):
+	X, Y = njobs.load_shared(X), njobs.load_shared(Y)
+	ret = func(X, Y[slc], **kwargs)
+	if (fpath is None): return ret
+	D = np.memmap(fpath, dtype=dtype, mode='r+', shape=shape, offset=offset)
+	D[:,slc] = ret
+	D.flush()
+	del D
+
+
+def parallel_pairwise(X, Y, func, n_jobs=1, symmetric=False, min_chunksize=1, out=None, dtype=None, **kwargs):
+	n_jobs = njobs.cpu_jobs(n_jobs)
 	if Y is None:
 		Y = X
+	if (out is None and dtype is not None):
+		out = np.empty((X.shape[0], Y.shape[0]), dtype=dtype)
 	if n_jobs == 1:
-		return func(X, Y, **kwargs)
-	# if (hasattr(Y, 'shape')):
-		# pairwise._parallel_pairwise(X, Y, func, n_jobs, **kwargs)
-	slices = [slice(min_chunksize*s.start,min_chunksize*s.stop) for s in gen_even_slices(len(Y)/min_chunksize, n_jobs)]
-	# ret = Parallel(n_jobs=n_jobs, verbose=5)(delayed(func)(X, Y[s], **kwargs) for s in slices)
-	# ret = njobs.run_pool(func, n_jobs=n_jobs, dist_param=['Y'], X=X, Y=[Y[s] for s in slices], **kwargs)
-	# ret = njobs.run_ipp(func, n_jobs=n_jobs, dist_param=['Y'], X=X, Y=[Y[s] for s in slices], **kwargs)
-	ret = [r.T for r in parmap.map(func, [Y[s] for s in slices], X, processes=n_jobs)] # have not supported passing kwargs to func
-	if (len(ret) == 0): return []
-	return np.hstack(ret)
-
-
-def normdist(D, range=None):
-	flatten_D = D.ravel()
-	minimum, maximum = flatten_D.min(), flatten_D.max()
-	if (minimum == maximum):
-		return np.ones_like(D)
-	if (range is None):
-		return (D - minimum) / (maximum - minimum)
+		if (out is None): return func(X, Y, **kwargs)
+		out[:] = func(X, Y, **kwargs)
+		return out
+	# Split Y into chunks of multiple min_chunksize rows, the last one takes the remainder
+	unit_num = (Y.shape[0] + min_chunksize - 1) / min_chunksize
+	slices = [slice(min_chunksize * s.start, min(min_chunksize * s.stop, Y.shape[0])) for s in njobs.split_slices(unit_num, split_num=n_jobs)]
+	if (len(slices) == 0): return []
+	# The workers write into the memory-mapped output directly if it is the whole C-contiguous mapping of a file, otherwise the results are gathered
+	fpath = out.filename if isinstance(out, np.memmap) and out.filename is not None and isinstance(out.base, mmap.mmap) and out.flags.c_contiguous else None
+	if (fpath is not None): out.flush()
+	X_hdl = njobs.dump_shared(X, fmt='csr')
+	Y_hdl = X_hdl if Y is X else njobs.dump_shared(Y, fmt='csr')
+	try:
+		ret = [r.get() for r in njobs.run_pool(_pairwise_tile, n_jobs=n_jobs, dist_param=['slc'], func=func, X=X_hdl, Y=Y_hdl, slc=slices, fpath=fpath, offset=0 if fpath is None else out.offset, dtype=None if out is None else out.dtype, shape=(X.shape[0], Y.shape[0]), kwargs=kwargs)]
+	finally:
+		njobs.free_shared(X_hdl)
+		if (Y_hdl is not X_hdl): njobs.free_shared(Y_hdl)
+	if (fpath is not None):
+		return out
+	if (out is None):
+		return np.hstack(ret)
+	for slc, r in zip(slices, ret):
+		out[:,slc] = r
+	return out
+
+
+def _pdist_block(X, Y, slc, symmetric, metric, n_jobs, kwargs):
+	D = pdist(X[slc], Y, metric=metric, n_jobs=n_jobs, **kwargs)
+	# The self-distance of a block against the whole matrix is not exactly zero
+	if (symmetric): D[np.arange(D.shape[0]), np.arange(slc.start, slc.start + D.shape[0])] = 0
+	return D
+
+
+def _pdist_tile(X, Y, fpath, dtype, shape, slc, symmetric, metric, kwargs):
+	X, Y = njobs.load_shared(X), njobs.load_shared(Y)
+	D = np.memmap(fpath, dtype=dtype, mode='r+', shape=shape)
+	D[slc] = _pdist_block(X, Y, slc, symmetric, metric, 1, kwargs)
+	D.flush()
+	del D
+
+
+def tiled_pdist(X, Y=None, metric='euclidean', n_jobs=1, tile_size=1024, dtype='float64', fpath=None, **kwargs):
+	# Compute the distance matrix in row tiles and write them straight into a memory-mapped file
+	symmetric = Y is None
+	if Y is None:
+		Y = X
+	n_jobs, shape = njobs.cpu_jobs(n_jobs), (X.shape[0], Y.shape[0])
+	is_tmp = fpath is None
+	if (is_tmp):
+		fd, fpath = tempfile.mkstemp(prefix='dstclc_', suffix='.mmap')
+		os.close(fd)
+	D = np.memmap(fpath, dtype=dtype, mode='w+', shape=shape)
+	slices = njobs.split_slices(shape[0], task_size=1, split_size=tile_size)
+	if (n_jobs == 1):
+		for slc in slices:
+			D[slc] = _pdist_block(X, Y, slc, symmetric, metric, 1, kwargs)
+	else:
+		D.flush()
+		X_hdl = njobs.dump_shared(X, fmt='csr')
+		Y_hdl = X_hdl if Y is X else njobs.dump_shared(Y, fmt='csr')
+		try:
+			[r.get() for r in njobs.run_pool(_pdist_tile, n_jobs=n_jobs, dist_param=['slc'], X=X_hdl, Y=Y_hdl, fpath=fpath, dtype=dtype, shape=shape, slc=slices, symmetric=symmetric, metric=metric, kwargs=kwargs)]
+		finally:
+			njobs.free_shared(X_hdl)
+			if (Y_hdl is not X_hdl): njobs.free_shared(Y_hdl)
+	D.flush()
+	# The mapping stays valid after the temporary file is unlinked
+	if (is_tmp): os.remove(fpath)
+	return D
+	
+	
+def tiled_nng(D, nn_method='rnn', nn_param=0.5, tile_size=1024):
+	# Build the nearest neighbor graph from the row tiles of a precomputed (memory-mapped) distance matrix
+	rows, cols, data = [], [], []
+	for start in xrange(0, D.shape[0], tile_size):
+		stop = min(start + tile_size, D.shape[0])
+		tile = np.array(D[start:stop], dtype='float64')
+		tile[np.arange(stop - start), np.arange(start, stop)] = np.inf
+		if (nn_method == 'rnn'):
+			row, col = np.nonzero(tile <= nn_param)
+		else:
+			k = min(int(nn_param), tile.shape[1] - 1)
+			col = np.argpartition(tile, k - 1, axis=1)[:,:k].ravel()
+			row = np.arange(stop - start).repeat(k)
+		rows.append(row + start)
+		cols.append(col)
+		data.append(tile[row, col])
+	return sp.sparse.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=D.shape)
+
+
+def _rp_leaves(X, leaf_size, random_state):
+	# Split the samples recursively by the median projection on the difference vector of two random samples
+	stack = [np.arange(X.shape[0])]
+	while (len(stack) > 0):
+		idx = stack.pop()
+		if (idx.shape[0] <= leaf_size):
+			yield idx
+			continue
+		a, b = random_state.choice(idx, 2, replace=False)
+		normal = X[a] - X[b]
+		proj = X[idx].dot(normal.T)
+		proj = (proj.toarray() if sp.sparse.issparse(proj) else np.asarray(proj)).ravel()
+		part = np.argpartition(proj, idx.shape[0] / 2)
+		stack.extend([idx[part[:idx.shape[0] / 2]], idx[part[idx.shape[0] / 2:]]])
+		
+		
+def _select_pairs(rows, cols, data, n, nn_method, nn_param):
+	# Remove the duplicated pairs and keep the nearest neighbors of each row
+	_, uniq_idx = np.unique(rows.astype('int64') * n + cols, return_index=True)
+	rows, cols, data = rows[uniq_idx], cols[uniq_idx], data[uniq_idx]
+	if (nn_method == 'rnn'):
+		mask = data <= nn_param
+		return rows[mask], cols[mask], data[mask]
+	order = np.lexsort((data, rows))
+	rows, cols, data = rows[order], cols[order], data[order]
+	rank = np.arange(rows.shape[0]) - np.searchsorted(rows, rows, side='left')
+	mask = rank < nn_param
+	return rows[mask], cols[mask], data[mask]
+	
+	
+def approx_nng(X, nn_method='knn', nn_param=10, metric='euclidean', n_trees=8, leaf_size=64, n_iters=1, chunk_size=1000000, random_state=None):
+	# Approximate nearest neighbor graph with a random projection forest and neighbor-of-neighbor refinement, the metric should be supported by paired_distances
+	X = X.tocsr() if sp.sparse.issparse(X) else np.asarray(X)
+	n = X.shape[0]
+	random_state = random_state if isinstance(random_state, np.random.RandomState) else np.random.RandomState(random_state)
+	if (nn_method != 'rnn'): nn_param = min(int(nn_param), n - 1)
+	leaf_size = max(leaf_size, nn_param + 1) if nn_method != 'rnn' else leaf_size
+	rows, cols, data = [], [], []
+	for t in xrange(n_trees):
+		for idx in _rp_leaves(X, leaf_size, random_state):
+			leaf_D = pdist(X[idx], metric=metric)
+			np.fill_diagonal(leaf_D, np.inf)
+			if (nn_method == 'rnn'):
+				row, col = np.nonzero(leaf_D <= nn_param)
+			else:
+				k = min(nn_param, idx.shape[0] - 1)
+				if (k < 1): continue
+				col = np.argpartition(leaf_D, k - 1, axis=1)[:,:k].ravel()
+				row = np.arange(idx.shape[0]).repeat(k)
+			rows.append(idx[row])
+			cols.append(idx[col])
+			data.append(leaf_D[row, col])
+	rows, cols, data = _select_pairs(np.concatenate(rows), np.concatenate(cols), np.concatenate(data), n, nn_method, nn_param)
+	for i in xrange(n_iters):
+		# The neighbors of the neighbors are the new candidates
+		G = sp.sparse.csr_matrix((np.ones_like(data), (rows, cols)), shape=(n, n))
+		cand = G.dot(G).tocoo()
+		mask = cand.row != cand.col
+		cand_rows, cand_cols = cand.row[mask], cand.col[mask]
+		cand_data = np.concatenate([paired_distances(X[cand_rows[j:j + chunk_size]], X[cand_cols[j:j + chunk_size]], metric=metric) for j in xrange(0, cand_rows.shape[0], chunk_size)] + [np.array([])])
+		rows, cols, data = _select_pairs(np.concatenate([rows, cand_rows]), np.concatenate([cols, cand_cols]), np.concatenate([data, cand_data]), n, nn_method, nn_param)
+	return sp.sparse.csr_matrix((data, (rows, cols)), shape=(n, n))
+
+
+SPARSE_METRICS = ['cosine', 'jaccard', 'dice']
+
+
+def _sparse_prep(X, metric):
+	X = sp.sparse.csr_matrix(X, dtype='float64')
+	if (metric == 'cosine'):
+		return X, np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+	# Jaccard and Dice coefficients are defined on the binary vectors
+	X = (X != 0).astype('float64')
+	return X, X.getnnz(axis=1).astype('float64')
+	
+	
+def _sparse_sim(inter, x_norm, y_norm, metric):
+	if (metric == 'cosine'):
+		return inter / (x_norm * y_norm)
+	elif (metric == 'jaccard'):
+		return inter / (x_norm + y_norm - inter)
+	elif (metric == 'dice'):
+		return 2 * inter / (x_norm + y_norm)
+	raise ValueError('Unsupported sparse metric %s, it should be one of %s' % (metric, ', '.join(SPARSE_METRICS)))
+	
+	
+def sparse_sim(X, Y=None, metric='cosine'):
+	# Similarities of the pairs that share at least one feature, the others are 0 and kept implicit
+	X, x_norm = _sparse_prep(X, metric)
+	Y, y_norm = (X, x_norm) if Y is None else _sparse_prep(Y, metric)
+	S = X.dot(Y.T).tocoo()
+	S.data = np.nan_to_num(_sparse_sim(S.data, x_norm[S.row], y_norm[S.col], metric))
+	return S.tocsr()
+	
+	
+def sparse_nng(X, nn_method='knn', nn_param=10, metric='cosine', chunk_size=1024):
+	# Nearest neighbor graph of distance 1 - similarity built from the sparse products of row chunks
+	X, x_norm = _sparse_prep(X, metric)
+	n, X_T = X.shape[0], X.T.tocsc()
+	rows, cols, data = [], [], []
+	for start in xrange(0, n, chunk_size):
+		S = X[start:start + chunk_size].dot(X_T).tocoo()
+		row, col = S.row + start, S.col
+		dist = 1 - np.nan_to_num(_sparse_sim(S.data, x_norm[row], x_norm[col], metric))
+		mask = row != col
+		row, col, dist = _select_pairs(row[mask], col[mask], dist[mask], n, nn_method, nn_param)
+		rows.append(row)
+		cols.append(col)
+		data.append(dist)
+	return sp.sparse.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+
+def minmax(D, chunk_size=None):
+	chunk_size = max(D.shape[0], 1) if chunk_size is None else chunk_size
+	minimum, maximum = np.inf, -np.inf
+	for start in xrange(0, D.shape[0], chunk_size):
+		block = D[start:start + chunk_size]
+		minimum, maximum = min(minimum, block.min()), max(maximum, block.max())
+	return minimum, maximum
+
+
+def normdist(D, range=None, dtype=None, inplace=False, chunk_size=None):
+	# The first pass finds the global minimum and maximum, the second one rescales the row blocks within the buffer
+	chunk_size = max(D.shape[0], 1) if chunk_size is None else chunk_size
+	minimum, maximum = minmax(D, chunk_size=chunk_size)
+	if (inplace):
+		D_norm = D
 	else:
-		return (range[1] - range[0]) * (D - minimum) / (maximum - minimum) + range[0]
+		D_norm = np.empty(D.shape, dtype=dtype if dtype is not None else (D.dtype if D.dtype.kind == 'f' else 'float64'))
+	for start in xrange(0, D.shape[0], chunk_size):
+		block = D_norm[start:start + chunk_size]
+		if (not inplace): block[:] = D[start:start + chunk_size]
+		if (minimum == maximum):
+			block[:] = 1
+			continue
+		block -= minimum
+		block /= maximum - minimum
+		if (range is not None):
+			block *= range[1] - range[0]
+			block += range[0]
+	if (isinstance(D_norm, np.memmap)): D_norm.flush()
+	return D_norm
 
 
 def sji_func(x, y):
 	return np.sum((x-y)**2)
 	
 	
-def sji(X, scaled=False):
-	if (scaled):
-		mms = MinMaxScaler()
-		X = mms.fit_transform(np.nan_to_num(X))
-	D = np.dot(D, D.T)
+def _sq_norm(X):
+	return np.asarray(X.multiply(X).sum(axis=1)).ravel() if sp.sparse.issparse(X) else np.square(X).sum(axis=1)
+	
+	
+def sji(X, Y=None, scaled=False, tile_size=None, out=None):
+	symmetric = Y is None
+	X = X.tocsr() if sp.sparse.issparse(X) else np.asarray(X, dtype='float64')
+	Y = X if symmetric else (Y.tocsr() if sp.sparse.issparse(Y) else np.asarray(Y, dtype='float64'))
+	if (scaled and sp.sparse.issparse(X)):
+		# The min-max shift cancels in x - y, dividing the sparse features by their ranges gives the same distances as MinMaxScaler
+		col_min, col_max = min_max_axis(X, axis=0)
+		col_rng = col_max - col_min
+		col_rng[col_rng == 0] = 1
+		scale = sp.sparse.diags(1.0 / col_rng)
+		X = X.dot(scale).tocsr()
+		Y = X if symmetric else (Y.dot(scale).tocsr() if sp.sparse.issparse(Y) else np.nan_to_num(Y) / col_rng)
+	elif (scaled):
+		scaler = MinMaxScaler()
+		X = scaler.fit_transform(np.nan_to_num(X))
+		Y = X if symmetric else scaler.transform(Y if sp.sparse.issparse(Y) else np.nan_to_num(Y))
+	# ||x - y||^2 = ||x||^2 + ||y||^2 - 2 x.y
+	x_sq, y_sq = _sq_norm(X), _sq_norm(Y)
+	Y_T = Y.T.tocsc() if sp.sparse.issparse(Y) else Y.T
+	D = np.empty((X.shape[0], Y.shape[0])) if out is None else out
+	tile_size = X.shape[0] if tile_size is None else tile_size
+	for start in xrange(0, X.shape[0], tile_size):
+		stop = min(start + tile_size, X.shape[0])
+		cross = X[start:stop].dot(Y_T)
+		cross = cross.toarray() if sp.sparse.issparse(cross) else np.asarray(cross)
+		tile = np.maximum(x_sq[start:stop].reshape((-1,1)) + y_sq.reshape((1,-1)) - 2 * cross, 0)
+		if (symmetric): tile[np.arange(stop - start), np.arange(start, stop)] = 0
+		D[start:stop] = tile
 	return D
 	
 	
-def z_dist(X):
-	f = lambda x: np.exp(-x) if x < 0 else 1
-	func = np.frompyfunc(f, 1, 1)
-	cov = np.cov(X.T)
-	D = np.ones((X.shape[0], X.shape[0]))
-	for i, j in itertools.combinations(range(X.shape[0]), 2):
-		delta = X[i] - X[j]
-		D[i, j] = D[j, i] = np.abs(np.dot(np.dot(delta, func(10 * cov)), delta.T))
+def z_dist(X, tile_size=1024, dtype='float64', out=None):
+	X = X.toarray() if sp.sparse.issparse(X) else np.asarray(X)
+	X = X.astype(dtype)
+	# Transform the covariance elementwise by f(x) = exp(-x) if x < 0 else 1, x = 10 * cov
+	cov = np.atleast_2d(np.cov(X.T))
+	M = np.exp(-10 * np.minimum(cov, 0))
+	# (x_i - x_j) M (x_i - x_j)^T = x_i M x_i^T + x_j M x_j^T - 2 x_i M x_j^T, M is symmetric
+	XM = np.dot(X, M)
+	sq_norm = (XM * X).sum(axis=1)
+	D = np.empty((X.shape[0], X.shape[0]), dtype=dtype) if out is None else out
+	for start in xrange(0, X.shape[0], tile_size):
+		stop = min(start + tile_size, X.shape[0])
+		tile = np.abs(sq_norm[start:stop].reshape((-1,1)) + sq_norm.reshape((1,-1)) - 2 * np.dot(XM[start:stop], X.T))
+		tile[np.arange(stop - start), np.arange(start, stop)] = 1
+		D[start:stop] = tile
 	return D
 	
 	
-def cns_dist(X, C=None, metric='euclidean', a=0.5, n_jobs=1, **kwargs):
-	D1 = pdist(X, metric=metric, n_jobs=n_jobs, **kwargs)
+def cns_dist(X, C=None, metric='euclidean', a=0.5, n_jobs=1, tile_size=None, fpath=None, dtype='float64', cache_dir=None, cache_size=8*1024**3, **kwargs):
+	if (cache_dir is not None):
+		# Key the cached float32 distance matrix on the fingerprint of the data and the parameters that change it
+		dist_cache = cache.MmapCache(cache_dir, max_bytes=cache_size)
+		key = hashlib.sha1('%s_%s_%s_%s' % (cache.mt_digest(X, C), metric, a, sorted(kwargs.items()))).hexdigest()
+		D = dist_cache.get(key)
+		if (D is not None): return D
+		return dist_cache.set(key, cns_dist(X, C=C, metric=metric, a=a, n_jobs=n_jobs, tile_size=tile_size, fpath=fpath, dtype=dtype, **kwargs))
+	if (tile_size is None and np.dtype(dtype) == np.float64):
+		D1 = pdist(X, metric=metric, n_jobs=n_jobs, **kwargs)
+	elif (tile_size is None):
+		# Fill the buffer of the narrower dtype by row blocks rather than casting the whole float64 matrix
+		D1 = np.empty((X.shape[0], X.shape[0]), dtype=dtype)
+		for slc in njobs.split_slices(X.shape[0], task_size=1, split_size=1024):
+			D1[slc] = _pdist_block(X, X, slc, True, metric, n_jobs, kwargs)
+	else:
+		D1 = tiled_pdist(X, metric=metric, n_jobs=n_jobs, tile_size=tile_size, dtype=dtype, fpath=fpath, **kwargs)
 	if (C is None): return D1
-	D2 = z_dist(C)
-	return (1 - a) * normdist(D1) + a * normdist(D2)
+	if (tile_size is None):
+		D2 = z_dist(C, dtype=dtype)
+	else:
+		# Keep the constraint distance on disk next to the memory-mapped instance distance
+		fd, D2_fpath = tempfile.mkstemp(prefix='dstclc_', suffix='.mmap')
+		os.close(fd)
+		D2 = z_dist(C, tile_size=tile_size, dtype=dtype, out=np.memmap(D2_fpath, dtype=dtype, mode='w+', shape=(C.shape[0], C.shape[0])))
+		os.remove(D2_fpath)
+	# Blend (1 - a) * normdist(D1) + a * normdist(D2) block by block inside the buffers of D1 and D2
+	D1, D2 = normdist(D1, inplace=True, chunk_size=tile_size), normdist(D2, inplace=True, chunk_size=tile_size)
+	chunk_size = D1.shape[0] if tile_size is None else tile_size
+	for start in xrange(0, D1.shape[0], chunk_size):
+		block, D2_block = D1[start:start + chunk_size], D2[start:start + chunk_size]
+		block *= 1 - a
+		D2_block *= a
+		block += D2_block
+		# The self-distance is zero, as the precomputed nearest neighbor graphs expect
+		block[np.arange(block.shape[0]), np.arange(start, start + block.shape[0])] = 0
+	if (isinstance(D1, np.memmap)): D1.flush()
+	return D1
 	
 	
 def infer_pdist(D=None, metric='manhattan', transpose=True, n_jobs=1, **kwargs):
+	if (D is not None and metric == 'manhattan'):
+		# The alternating cumulative sums of the superdiagonal of D are computed once and reused in every call
+		sign = (-1.0) ** np.arange(D.shape[0])
+		alt_cumsum = sign * np.cumsum(np.append(0, sign[1:] * np.diagonal(D, offset=1)))
 	def func(X, Y):
-		PD = pdist(X, Y, metric=metric, n_jobs=1, **kwargs)
-		if D is None: return PD
-		if (metric == 'euclidean'):
-			pass
-		elif (metric == 'manhattan'):
-			for i in xrange(PD.shape[0]):
-				for j in [x for x in range(PD.shape[0]) if x != i]:
-					PD[j] = D[i,j] * np.ones_like(PD[i]) - PD[i]
+		if D is None: return pdist(X, Y, metric=metric, n_jobs=1, **kwargs)
+		if (metric == 'manhattan' and X.shape[0] <= D.shape[0]):
+			# Sequentially assigning PD[j] = D[i,j] - PD[i] for each i and each j != i leaves the row r = PD[n-1] and PD[j] = D[n-1,j] - r, where r only depends on PD[0]
+			n = X.shape[0]
+			r = alt_cumsum[n-1] + sign[n-1] * pdist(X[:1], Y, metric=metric, n_jobs=1, **kwargs)[0]
+			PD = np.asarray(D[n-1,:n], dtype='float64').reshape((-1,1)) - r.reshape((1,-1))
+			PD[n-1] = r
+		else:
+			PD = pdist(X, Y, metric=metric, n_jobs=1, **kwargs)
 		return PD.T if transpose else PD
 	return func
 	
+	
 def gen_dstclc(func, **kwargs):
 	return FunctionTransformer(func=func, **kwargs)
\ No newline at end of file
@@ -18,29 +18,83 @@ import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.feature_selection import SelectKBest
 
-from util import io
+from util import io, njobs, cache
+
+
+# Contingency counts shared by the scoring functions that run on the same (X, Y)
+COOC_CACHE = cache.LRUCache(max_bytes=512*1024**2)
+	
+	
+def _check_mt(X):
+	if (sp.sparse.issparse(X)):
+		return X.tocsr()
+	X = np.asarray(X)
+	return X.reshape((-1, 1)) if len(X.shape) == 1 else X
+	
+	
+def cooc_cnt(X, Y):
+	X, Y = _check_mt(X), _check_mt(Y)
+	if (sp.sparse.issparse(X)):
+		coocrnc = X.T.dot(Y).T
+	elif (sp.sparse.issparse(Y)):
+		coocrnc = Y.T.dot(X)
+	else:
+		coocrnc = np.dot(Y.T, X)
+	coocrnc = coocrnc.toarray() if sp.sparse.issparse(coocrnc) else np.asarray(coocrnc)
+	x_sum, y_sum = np.asarray(X.sum(axis=0)).ravel(), np.asarray(Y.sum(axis=0)).ravel()
+	return coocrnc, x_sum, y_sum, X.shape[0]
 	
 	
-def cooc_mt(X, Y):
-	nX, nY = 1 - X, 1 - Y
-	coocrnc, nxny_coocrnc = np.dot(Y.T, X), np.dot(nY.T, nX)
-	nx_coocrnc, ny_coocrnc = np.dot(Y.T, nX), np.dot(nY.T, X)
+def cooc_derive(coocrnc, x_sum, y_sum, n):
+	# (1-Y)^T X, Y^T (1-X) and (1-Y)^T (1-X) follow from Y^T X and the marginals
+	nx_coocrnc = y_sum.reshape((-1,1)) - coocrnc
+	ny_coocrnc = x_sum.reshape((1,-1)) - coocrnc
+	nxny_coocrnc = n - y_sum.reshape((-1,1)) - ny_coocrnc
 	return coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc
 	
 	
-def cooc_stat(X, Y, coocrnc):
-	coocrnc_avg = coocrnc / Y.sum(axis=0).reshape((-1,1)).repeat(X.shape[1], axis=1)
-	xy = X.reshape((X.shape[0], 1, X.shape[1])).repeat(Y.shape[1], axis=1) * Y.reshape((Y.shape[0], Y.shape[1], 1)).repeat(X.shape[1], axis=2)
-	coocrnc_std = np.sqrt(np.square(xy - coocrnc_avg.reshape((1, coocrnc_avg.shape[0], coocrnc_avg.shape[1])).repeat(xy.shape[0], axis=0)).mean(axis=0))
+def cooc_mt(X, Y, use_cache=True):
+	if (not use_cache or COOC_CACHE.max_bytes <= 0):
+		return cooc_derive(*cooc_cnt(X, Y))
+	key = cache.mt_digest(X, Y)
+	cnt = COOC_CACHE.get(key)
+	if (cnt is None):
+		cnt = cooc_cnt(X, Y)
+		for a in cnt[:3]: a.flags.writeable = False
+		COOC_CACHE.set(key, cnt)
+	return cooc_derive(*cnt)
+	
+	
+def cooc_accum(X, Y, cnt=None):
+	coocrnc, x_sum, y_sum, n = cooc_cnt(X, Y)
+	if (cnt is None): return coocrnc, x_sum, y_sum, n
+	return cnt[0] + coocrnc, cnt[1] + x_sum, cnt[2] + y_sum, cnt[3] + n
+	
+	
+def _square_mt(X):
+	return X.power(2) if sp.sparse.issparse(X) else np.square(X)
+	
+	
+def cooc_stat(X, Y, coocrnc, sq_coocrnc=None):
+	X, Y = _check_mt(X), _check_mt(Y)
+	if (sq_coocrnc is None): sq_coocrnc = cooc_cnt(_square_mt(X), _square_mt(Y))[0]
+	coocrnc_avg = 1.0 * coocrnc / np.asarray(Y.sum(axis=0)).reshape((-1,1))
+	# mean((xy - avg)^2) = (sum(xy^2) - 2 * avg * sum(xy)) / n + avg^2
+	coocrnc_var = (sq_coocrnc - 2 * coocrnc_avg * coocrnc) / X.shape[0] + np.square(coocrnc_avg)
+	coocrnc_std = np.sqrt(np.clip(coocrnc_var, 0, None))
 	return coocrnc_avg, coocrnc_std
 	
 	
-def gu_metric(X, Y, scaled=True):
-	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc_mt(X, Y)
+def _gu_metric(cooc):
+	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc
 	y_sum, ny_sum = coocrnc + nx_coocrnc, ny_coocrnc + nxny_coocrnc
 	p = 1.0 * (ny_coocrnc + coocrnc) / (y_sum + ny_sum)
 	z = 1.0 * (coocrnc - ny_coocrnc) / np.sqrt(p * (1 - p) * (1.0 / y_sum + 1.0 / ny_sum))
-	gu = (np.fabs(z) * coocrnc * ny_sum / (y_sum * ny_coocrnc)).sum(axis=0)
+	return np.fabs(z) * coocrnc * ny_sum / (y_sum * ny_coocrnc)
+	
+	
+def gu_metric(X, Y, scaled=True):
+	gu = _gu_metric(cooc_mt(X, Y)).sum(axis=0)
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(gu).reshape((-1,1))).ravel(), np.zeros_like(gu)
@@ -48,11 +102,17 @@ def gu_metric(X, Y, scaled=True):
 		return np.nan_to_num(gu), np.zeros_like(gu)
 
 	
-def fisher_crtrn(X, Y, scaled=True):
+def _fisher_crtrn(X, Y):
+	X, Y = _check_mt(X), _check_mt(Y)
+	nY = 1 - (Y.toarray() if sp.sparse.issparse(Y) else Y)
 	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc_mt(X, Y)
 	coocrnc_avg, coocrnc_std = cooc_stat(X, Y, coocrnc)
-	ny_coocrnc_avg, ny_coocrnc_std = cooc_stat(X, 1-Y, ny_coocrnc)
-	fc = (np.square(coocrnc_avg - ny_coocrnc_avg) / (np.square(coocrnc_std) + np.square(ny_coocrnc_std))).sum(axis=0)
+	ny_coocrnc_avg, ny_coocrnc_std = cooc_stat(X, nY, ny_coocrnc)
+	return np.square(coocrnc_avg - ny_coocrnc_avg) / (np.square(coocrnc_std) + np.square(ny_coocrnc_std))
+	
+	
+def fisher_crtrn(X, Y, scaled=True):
+	fc = _fisher_crtrn(X, Y).sum(axis=0)
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(fc).reshape((-1,1))).ravel(), np.zeros_like(fc)
@@ -60,6 +120,11 @@ def fisher_crtrn(X, Y, scaled=True):
 		return np.nan_to_num(fc), np.zeros_like(fc)
 	
 	
+def _odds_ratio(cooc):
+	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc
+	return 1.0 * (coocrnc * nxny_coocrnc) / (nx_coocrnc * ny_coocrnc)
+	
+	
 def odds_ratio(X, Y, scaled=True):
 	# nY = 1 - Y
 	# y_freqs, ny_freqs = Y.sum(axis=0), nY.sum(axis=0)
@@ -67,8 +132,7 @@ def odds_ratio(X, Y, scaled=True):
 	# cond_prob, ncond_prob = 1.0 * cond_freqs / y_freqs.reshape((-1,1)).repeat(cond_freqs.shape[1], axis=1), 1.0 * ncond_freqs / ny_freqs.reshape((-1,1)).repeat(ncond_freqs.shape[1], axis=1)
 	# or_sum = ((cond_prob * (1 - ncond_prob)) / ((1 - cond_prob) * ncond_prob)).sum(axis=0)
 	
-	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc_mt(X, Y)
-	or_sum = (1.0 * (coocrnc * nxny_coocrnc) / (nx_coocrnc * ny_coocrnc)).sum(axis=0)
+	or_sum = _odds_ratio(cooc_mt(X, Y)).sum(axis=0)
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(or_sum).reshape((-1,1))).ravel(), np.zeros_like(or_sum)
@@ -76,6 +140,12 @@ def odds_ratio(X, Y, scaled=True):
 		return np.nan_to_num(or_sum), np.zeros_like(or_sum)
 	
 	
+def _ngl_coef(cooc):
+	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc
+	n = coocrnc + nxny_coocrnc + nx_coocrnc + ny_coocrnc
+	return n ** 0.5 * (coocrnc * nxny_coocrnc - nx_coocrnc * ny_coocrnc) / np.sqrt((coocrnc + nx_coocrnc) * (ny_coocrnc + nxny_coocrnc) * (coocrnc + ny_coocrnc) * (nx_coocrnc + nxny_coocrnc))
+	
+	
 def ngl_coef(X, Y, scaled=True):
 	# nX, nY = 1 - X, 1 - Y
 	# x_freqs, y_freqs = X.sum(axis=0), Y.sum(axis=0)
@@ -87,8 +157,7 @@ def ngl_coef(X, Y, scaled=True):
 	# nx_joint_prob, ny_joint_prob = 1.0 * np.dot(Y.T, nX) / X.shape[0], 1.0 * np.dot(nY.T, X) / X.shape[0]
 	# ngl = (X.shape[0] ** 0.5 * (joint_prob * nxny_joint_prob - nx_joint_prob * ny_joint_prob) / np.sqrt(x_prob_mt * y_prob_mt * nx_prob_mt * ny_prob_mt)).sum(axis=0)
 
-	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc_mt(X, Y)
-	ngl = (X.shape[0] ** 0.5 * (coocrnc * nxny_coocrnc - nx_coocrnc * ny_coocrnc) / np.sqrt((coocrnc + nx_coocrnc) * (ny_coocrnc + nxny_coocrnc) * (coocrnc + ny_coocrnc) * (nx_coocrnc + nxny_coocrnc))).sum(axis=0)
+	ngl = _ngl_coef(cooc_mt(X, Y)).sum(axis=0)
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(ngl).reshape((-1,1))).ravel(), np.zeros_like(ngl)
@@ -96,14 +165,18 @@ def ngl_coef(X, Y, scaled=True):
 		return np.nan_to_num(ngl), np.zeros_like(ngl)
 	
 	
+def _gss_coef(cooc):
+	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc
+	return coocrnc * nxny_coocrnc - nx_coocrnc * ny_coocrnc
+	
+	
 def gss_coef(X, Y, scaled=True):
 	# nX, nY = 1 - X, 1 - Y
 	# joint_prob, nxny_joint_prob = 1.0 * np.dot(Y.T, X) / X.shape[0], 1.0 * np.dot(nY.T, nX) / X.shape[0]
 	# nx_joint_prob, ny_joint_prob = 1.0 * np.dot(Y.T, nX) / X.shape[0], 1.0 * np.dot(nY.T, X) / X.shape[0]
 	# gss = (joint_prob * nxny_joint_prob - nx_joint_prob * ny_joint_prob).sum(axis=0)
 	
-	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc_mt(X, Y)
-	gss = (coocrnc * nxny_coocrnc - nx_coocrnc * ny_coocrnc).sum(axis=0)
+	gss = _gss_coef(cooc_mt(X, Y)).sum(axis=0)
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(gss).reshape((-1,1))).ravel(), np.zeros_like(gss)
@@ -111,6 +184,17 @@ def gss_coef(X, Y, scaled=True):
 		return np.nan_to_num(gss), np.zeros_like(gss)
 
 	
+def _info_gain(cooc):
+	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc
+	n = coocrnc + nxny_coocrnc + nx_coocrnc + ny_coocrnc
+	x_sum, nx_sum, y_sum, ny_sum, xor_sum = coocrnc + ny_coocrnc, nx_coocrnc + nxny_coocrnc, coocrnc + nx_coocrnc, ny_coocrnc + nxny_coocrnc, nx_coocrnc + ny_coocrnc
+	x_prob, y_prob = 1.0 * x_sum / n, 1.0 * y_sum / n
+	nx_prob, ny_prob = 1 - x_prob, 1.0 * ny_sum / n
+	joint_prob, nxny_joint_prob = 1.0 * coocrnc / x_sum, 1.0 * nxny_coocrnc / xor_sum
+	nx_joint_prob, ny_joint_prob = 1.0 * nx_coocrnc / xor_sum, 1.0 * ny_coocrnc / x_sum
+	return -1 * y_prob * np.log2(y_prob) + ny_prob * np.log2(ny_prob) - (x_prob * (-1 * joint_prob * np.log2(joint_prob) - ny_prob * np.log2(ny_prob))) + (nx_prob * (-1 * nx_joint_prob * np.log2(nx_joint_prob) - nxny_joint_prob * np.log2(nxny_joint_prob)))
+	
+	
 def info_gain(X, Y, scaled=True):
 	# x_freqs, y_freqs = X.sum(axis=0), Y.sum(axis=0)
 	# x_prob, y_prob = 1.0 * x_freqs / X.shape[0], 1.0 * y_freqs / Y.shape[0]
@@ -121,13 +205,7 @@ def info_gain(X, Y, scaled=True):
 	# njoint_prob = 1 - joint_prob
 	# ig = (joint_prob * np.log(joint_prob / (y_prob_mt * x_prob_mt)) + njoint_prob * np.log(njoint_prob / (y_prob_mt * nx_prob_mt))).sum(axis=0)
 	
-	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc_mt(X, Y)
-	x_sum, nx_sum, y_sum, ny_sum, xor_sum = coocrnc + ny_coocrnc, nx_coocrnc + nxny_coocrnc, coocrnc + nx_coocrnc, ny_coocrnc + nxny_coocrnc, nx_coocrnc + ny_coocrnc
-	x_prob, y_prob = 1.0 * x_sum / X.shape[0], 1.0 * y_sum / X.shape[0]
-	nx_prob, ny_prob = 1 - x_prob, 1.0 * ny_sum / X.shape[0]
-	joint_prob, nxny_joint_prob = 1.0 * coocrnc / x_sum, 1.0 * nxny_coocrnc / xor_sum
-	nx_joint_prob, ny_joint_prob = 1.0 * nx_coocrnc / xor_sum, 1.0 * ny_coocrnc / x_sum
-	ig = (-1 * y_prob * np.log2(y_prob) + ny_prob * np.log2(ny_prob) - (x_prob * (-1 * joint_prob * np.log2(joint_prob) - ny_prob * np.log2(ny_prob))) + (nx_prob * (-1 * nx_joint_prob * np.log2(nx_joint_prob) - nxny_joint_prob * np.log2(nxny_joint_prob)))).sum(axis=0)
+	ig = _info_gain(cooc_mt(X, Y)).sum(axis=0)
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(ig).reshape((-1,1))).ravel(), np.zeros_like(ig)
@@ -135,6 +213,12 @@ def info_gain(X, Y, scaled=True):
 		return np.nan_to_num(ig), np.zeros_like(ig)
 	
 	
+def _mutual_info(cooc):
+	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc
+	n = coocrnc + nxny_coocrnc + nx_coocrnc + ny_coocrnc
+	return 1.0 * (coocrnc * n) / ((coocrnc + nx_coocrnc) * (coocrnc + ny_coocrnc))
+	
+	
 def mutual_info(X, Y, scaled=True):
 	# x_freqs, y_freqs = X.sum(axis=0), Y.sum(axis=0)
 	# x_prob, y_prob = 1.0 * x_freqs / X.shape[0], 1.0 * y_freqs / Y.shape[0]
@@ -143,8 +227,7 @@ def mutual_info(X, Y, scaled=True):
 	# mi = np.log(joint_prob / (y_prob_mt * x_prob_mt)).sum(axis=0)
 	# return np.nan_to_num(mi), np.zeros_like(mi)
 	
-	coocrnc, nxny_coocrnc, nx_coocrnc, ny_coocrnc = cooc_mt(X, Y)
-	mi = (1.0 * (coocrnc * X.shape[0]) / ((coocrnc + nx_coocrnc) * (coocrnc + ny_coocrnc))).sum(axis=0)
+	mi = _mutual_info(cooc_mt(X, Y)).sum(axis=0)
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(mi).reshape((-1,1))).ravel(), np.zeros_like(mi)
@@ -154,14 +237,13 @@ def mutual_info(X, Y, scaled=True):
 	
 def freqs(X, Y, min_t=1, max_t=None, scaled=True):
 	if (max_t is None): max_t = X.shape[0]
-	mt = sp.sparse.coo_matrix(X)
-	mask_mt = np.zeros(mt.shape)
-	mask_mt[mt.row, mt.col] = 1
-	stat = mask_mt.sum(axis=0)
-	return np.nan_to_num(stat), np.zeros_like(stat)
-	stat[np.any([stat < min_t, stat > min_t], axis=0)] = 0
-	median = np.median(stat[stat > 0])
-	fi = (np.fabs(stat - median) + 0.5)**(-2)
+	# Document frequency of each feature, (X != 0) stays sparse for the sparse input
+	stat = np.asarray((X != 0).sum(axis=0), dtype='float64').ravel()
+	mask = (stat >= min_t) & (stat <= max_t)
+	fi = np.zeros_like(stat)
+	if (mask.any()):
+		median = np.median(stat[mask])
+		fi[mask] = (np.fabs(stat[mask] - median) + 0.5)**(-2)
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(fi).reshape((-1,1))).ravel(), np.zeros_like(fi)
@@ -182,23 +264,32 @@ def decision_tree(X, Y, scaled=True):
 
 
 def filtref(cur_f, ref_f, ori_f=None):
-	cur_X, ref_X = io.read_df(cur_f, with_idx=True, sparse_fmt='csr'), io.read_df(ref_f, with_idx=True, sparse_fmt='csr')
-	ori_X = io.read_df(ori_f, sparse_fmt='csr') if ori_f is not None else None
-	fi_df = pd.DataFrame([[1] * cur_X.shape[1]], columns=cur_X.columns)
+	cur_cols, ref_cols = io.read_df_col(cur_f), io.read_df_col(ref_f)
+	ori_cols = io.read_df_col(ori_f) if ori_f is not None else None
 	if (ori_f is None):
-		filtout = list(set(cur_X.columns) - set(ref_X.columns))
+		filtout = set(cur_cols) - set(ref_cols)
 	else:
-		filtout = list((set(ori_X.columns) - set(ref_X.columns)) & set(cur_X.columns))
-	fi_df.loc[:,filtout] = 0
-	fi = fi_df.values.ravel().tolist()
+		filtout = (set(ori_cols) - set(ref_cols)) & set(cur_cols)
+	fi = [0 if col in filtout else 1 for col in cur_cols]
 	def func(X, y):
 		return fi, np.zeros_like(fi)
 	return func
 	
 	
-def gen_fis(X, Y, filtfunc=freqs, scaled=True, **kwargs):
+# Scoring functions that can score all the labels from one shared co-occurrence computation
+COOC_SCORERS = {gu_metric:_gu_metric, odds_ratio:_odds_ratio, ngl_coef:_ngl_coef, gss_coef:_gss_coef, info_gain:_info_gain, mutual_info:_mutual_info}
+
+
+def gen_fis(X, Y, filtfunc=freqs, scaled=True, batched=True, **kwargs):
 	fi_list, pval_list = [[] for i in range(2)]
 	if (len(Y.shape) == 1): Y = Y.reshape((-1, 1))
+	if (batched and len(kwargs) == 0 and (filtfunc in COOC_SCORERS or filtfunc is fisher_crtrn)):
+		fi_mt = _fisher_crtrn(X, Y) if filtfunc is fisher_crtrn else COOC_SCORERS[filtfunc](cooc_mt(X, Y))
+		fi_mt = np.nan_to_num(fi_mt)
+		if (scaled):
+			mms = MinMaxScaler()
+			fi_mt = mms.fit_transform(fi_mt.T).T
+		return fi_mt, np.zeros_like(fi_mt)
 	for i in xrange(Y.shape[1]):
 		y = Y[:,i].reshape((-1,1))
 		fi, pval = filtfunc(X, y, scaled=scaled, **kwargs)
@@ -210,11 +301,11 @@ def gen_fis(X, Y, filtfunc=freqs, scaled=True, **kwargs):
 def utopk(X, Y, filtfunc=freqs, fsw=1, fn=10, scaled=True, **kwargs):
 	fi_mt, _ = gen_fis(X, Y, filtfunc, scaled=False, **kwargs)
 	#reduce(np.union1d, fi_mt.argsort(axis=1)[:,-fn:][:,::-1])
-	slct_idx1 = fi_mt.argsort(axis=1)[:,-fn:][:,::-1]
-	slct_idx0 = np.arange(fi_mt.shape[0]).reshape((-1,1)).repeat(slct_idx1.shape[1], axis=1)
-	fi_count = np.zeros_like(fi_mt)
-	fi_count[slct_idx0.ravel(), slct_idx1.ravel()] = 1
-	fi = (fi_mt * fi_count).sum(axis=0)
+	fn = min(fn, fi_mt.shape[1])
+	# Unordered top-fn features of each label, O(n_features) per label
+	slct_idx = np.argpartition(fi_mt, -fn, axis=1)[:,-fn:]
+	slct_fi = fi_mt[np.arange(fi_mt.shape[0]).reshape((-1,1)), slct_idx]
+	fi = np.bincount(slct_idx.ravel(), weights=slct_fi.ravel(), minlength=fi_mt.shape[1])
 	if (scaled):
 		mms = MinMaxScaler()
 		return mms.fit_transform(np.nan_to_num(fi).reshape((-1,1))).ravel(), np.zeros_like(fi)
@@ -222,12 +313,76 @@ def utopk(X, Y, filtfunc=freqs, fsw=1, fn=10, scaled=True, **kwargs):
 		return np.nan_to_num(fi), np.zeros_like(fi)
 	
 	
+def _read_shard(fpath, sparse_fmt='csr'):
+	npzfile = io.read_npz(fpath)
+	if ('indices' not in npzfile.files):
+		return npzfile['data']
+	return io.read_spmt(fpath, sparse_fmt=sparse_fmt)
+	
+	
+def _check_cooc_scorer(filtfunc):
+	if (filtfunc not in COOC_SCORERS):
+		raise ValueError('Incremental scoring only supports the contingency based scoring functions: %s' % ', '.join([f.__name__ for f in COOC_SCORERS.keys()]))
+	
+	
+def cooc_score(cnt, filtfunc=gu_metric, scaled=True):
+	_check_cooc_scorer(filtfunc)
+	fi = COOC_SCORERS[filtfunc](cooc_derive(*cnt)).sum(axis=0)
+	if (scaled):
+		mms = MinMaxScaler()
+		return mms.fit_transform(np.nan_to_num(fi).reshape((-1,1))).ravel(), np.zeros_like(fi)
+	else:
+		return np.nan_to_num(fi), np.zeros_like(fi)
+	
+	
+def shard_score(X_fpaths, Y=None, Y_fpaths=None, filtfunc=gu_metric, sparse_fmt='csr', scaled=True):
+	_check_cooc_scorer(filtfunc)
+	cnt, offset = None, 0
+	for i, fpath in enumerate(X_fpaths):
+		X = _read_shard(fpath, sparse_fmt=sparse_fmt)
+		y = _read_shard(Y_fpaths[i], sparse_fmt=sparse_fmt) if Y_fpaths is not None else Y[offset:offset + X.shape[0]]
+		offset += X.shape[0]
+		cnt = cooc_accum(X, y, cnt)
+		del X, y
+	if (Y_fpaths is None and offset != Y.shape[0]):
+		raise ValueError('The shards contain %i samples while Y has %i rows' % (offset, Y.shape[0]))
+	return cooc_score(cnt, filtfunc=filtfunc, scaled=scaled)
+	
+	
 def gen_ftslct_func(func, **kwargs):
 	def ftslct_func(X, Y):
 		return func(X, Y, **kwargs)
 	return ftslct_func
 	
 	
+def _score_chunk(score_func, X, Y, slc, kwargs):
+	X = njobs.load_shared(X)
+	return score_func(X[:,slc], Y, **kwargs)
+	
+	
+def mp_score(score_func, X, Y, n_jobs=1, chunk_size=None, **kwargs):
+	# Only the scoring functions that score each feature independently can be split along the feature axis
+	if ((n_jobs == 1 and chunk_size is None) or (score_func not in COOC_SCORERS and score_func is not fisher_crtrn)):
+		return score_func(X, Y, **kwargs)
+	n_jobs, scaled = njobs.cpu_jobs(n_jobs), kwargs.pop('scaled', True)
+	kwargs['scaled'] = False
+	X = sp.sparse.csc_matrix(X) if sp.sparse.issparse(X) else np.asarray(X)
+	slices = njobs.split_slices(X.shape[1], task_size=1, split_size=chunk_size) if chunk_size else njobs.split_slices(X.shape[1], split_num=n_jobs)
+	if (n_jobs == 1):
+		res_list = [score_func(X[:,slc], Y, **kwargs) for slc in slices]
+	else:
+		X_hdl = njobs.dump_shared(X, fmt='csc')
+		try:
+			res_list = [r.get() for r in njobs.run_pool(_score_chunk, n_jobs=n_jobs, dist_param=['slc'], score_func=score_func, X=X_hdl, Y=Y, slc=slices, kwargs=kwargs)]
+		finally:
+			njobs.free_shared(X_hdl)
+	fi, pval = [np.hstack([np.asarray(r[i]).ravel() for r in res_list]) for i in range(2)]
+	if (scaled):
+		mms = MinMaxScaler()
+		fi = mms.fit_transform(fi.reshape((-1,1))).ravel()
+	return fi, pval
+	
+	
 def lasso_path(spdr):
 	import matplotlib as mpl
 	mpl.use('Agg')
@@ -262,30 +417,61 @@ def lasso_path(spdr):
 	plt.savefig('lasso_path')
 
 
+def _cooc_fit(slct, X, Y, cnt=None):
+	# Keep the running contingency counts so that partial_fit rescores from them without revisiting the former batches
+	slct.cooc_cnt_ = cooc_accum(X, Y, cnt)
+	slct.scores_, slct.pvalues_ = cooc_score(slct.cooc_cnt_, filtfunc=slct.score_func, **slct.sf_kwargs)
+	
+	
+def _fit_score(slct, X, Y):
+	if (slct.score_func in COOC_SCORERS):
+		_cooc_fit(slct, X, Y)
+	else:
+		slct.__dict__.pop('cooc_cnt_', None)
+		slct.scores_, slct.pvalues_ = mp_score(slct.score_func, X, Y, n_jobs=slct.n_jobs, chunk_size=slct.chunk_size, **slct.sf_kwargs)
+	slct.scores_, slct.pvalues_ = np.asarray(slct.scores_), np.asarray(slct.pvalues_)
+	
+	
+def _partial_score(slct, X, Y):
+	_check_cooc_scorer(slct.score_func)
+	_cooc_fit(slct, X, Y, getattr(slct, 'cooc_cnt_', None))
+
+
 class MSelectKBest(SelectKBest):
 #	ff_kwargs = {}
-	def __init__(self, score_func=freqs, k=10, **kwargs):
+	def __init__(self, score_func=freqs, k=10, n_jobs=1, chunk_size=None, **kwargs):
 #		if len(kwargs)>0: MSelectKBest.ff_kwargs = kwargs
 		super(MSelectKBest, self).__init__(score_func)
 		self.k = k
+		self.n_jobs = n_jobs
+		self.chunk_size = chunk_size
 		self.sf_kwargs = kwargs
 
 	def fit(self, X, Y):
 #		self.scores_, self.pvalues_ = self.score_func(X, Y, **MSelectKBest.ff_kwargs)
-		self.scores_, self.pvalues_ = self.score_func(X, Y, **self.sf_kwargs)
-		self.scores_, self.pvalues_ = np.asarray(self.scores_), np.asarray(self.pvalues_)
+		_fit_score(self, X, Y)
+		return self
+		
+	def partial_fit(self, X, Y):
+		_partial_score(self, X, Y)
 		return self
 		
 		
 class MSelectOverValue(SelectKBest):
-	def __init__(self, score_func=freqs, threshold=0, **kwargs):
+	def __init__(self, score_func=freqs, threshold=0, n_jobs=1, chunk_size=None, **kwargs):
 		super(MSelectOverValue, self).__init__(score_func)
 		self.threshold = threshold
+		self.n_jobs = n_jobs
+		self.chunk_size = chunk_size
 		self.sf_kwargs = kwargs
 
 	def fit(self, X, Y):
-		self.scores_, self.pvalues_ = self.score_func(X, Y, **self.sf_kwargs)
-		self.scores_, self.pvalues_ = np.asarray(self.scores_), np.asarray(self.pvalues_)
+		_fit_score(self, X, Y)
+		self.k = len(self.scores_[self.scores_ > self.threshold])
+		return self
+		
+	def partial_fit(self, X, Y):
+		_partial_score(self, X, Y)
 		self.k = len(self.scores_[self.scores_ > self.threshold])
 		return self
 
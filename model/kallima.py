@@ -8,13 +8,9 @@
 # Created Time: 2017-03-01 19:56:33
 ###########################################################################
 
-import os
-from itertools import product, combinations
-from collections import Counter
-
 import numpy as np
 import networkx as nx
-from scipy.sparse import csr_matrix, coo_matrix, find
+from scipy.sparse import csr_matrix, coo_matrix, issparse
 from scipy.sparse import linalg as spla
 from scipy.sparse.csgraph import minimum_spanning_tree, connected_components
 
@@ -63,8 +59,14 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 		Whether or not to save the graph model
 	n_jobs : int, optional (default = 1)
 		The number of parallel jobs to run for neighbors search. If -1, then the number of jobs is set to the number of CPU cores
+	tile_size : int, optional (default = None)
+		The number of rows per block when computing the distance matrix into a memory-mapped file and building the nearest neighbor graph block by block. If None, the whole distance matrix is computed in memory
+	cache_dir : string, optional (default = None)
+		The directory of the persistent distance matrix cache keyed by the fingerprint of the data, the constraint, the metric and cns_ratio. If None, the distance matrix is not cached
+	approx_nn : boolean, optional (default = False)
+		Whether or not to build an approximate nearest neighbor graph straight from the feature vectors with random projection trees instead of the full distance matrix, it is only used without constraint. Sparse input with the cosine, jaccard or dice metric uses the sparse similarity products instead
 	'''
-	def __init__(self, metric='euclidean', method='mstcut', cut_method='normcut', cut_step=0.1, cns_ratio=0.5, nn_method='rnn', nn_param=0.5, max_cltnum=100, coarse=0.4, rcexp=1, cond=0.3, cross_merge=False, merge_all=False, save_g=False, n_jobs=1):
+	def __init__(self, metric='euclidean', method='mstcut', cut_method='normcut', cut_step=0.1, cns_ratio=0.5, nn_method='rnn', nn_param=0.5, max_cltnum=100, coarse=0.4, rcexp=1, cond=0.3, cross_merge=False, merge_all=False, save_g=False, n_jobs=1, tile_size=None, cache_dir=None, approx_nn=False):
 		self.metric = metric
 		self.method = method
 		self.cut_method = cut_method
@@ -80,6 +82,9 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 		self.merge_all = merge_all
 		self.save_g = save_g
 		self.n_jobs = n_jobs
+		self.tile_size = tile_size
+		self.cache_dir = cache_dir
+		self.approx_nn = approx_nn
 
 	def fit(self, X, y=None, constraint=None):
 		'''Compute Constraint Kallima clustering.
@@ -91,16 +96,20 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 		X = check_array(X, accept_sparse="csr", order='C', dtype=[np.float64, np.float32, np.float16, np.int64, np.int32, np.int16, np.int8])
 		self.mdl_name = '%s%s%s' % ('' if constraint is None else 'cns', self.nn_method, self.nn_param)
 		## Calculate the distance
-		if (os.path.exists('../distance_matrix.npz')):
-			X = io.read_npz('../distance_matrix.npz')['data']
-			self.metric = 'precomputed'
 		if (self.metric == 'precomputed'):
 			D = X
+		elif (self.approx_nn and constraint is None):
+			D = None
 		else:
-			D = dstclc.cns_dist(X, C=constraint, metric=self.metric, a=self.cns_ratio, n_jobs=self.n_jobs)
-			io.write_npz(D, fpath='distance_matrix', compress=True)
+			D = dstclc.cns_dist(X, C=constraint, metric=self.metric, a=self.cns_ratio, n_jobs=self.n_jobs, tile_size=self.tile_size, cache_dir=self.cache_dir)
 		## Build the nearest neighbor graph
-		if (self.nn_method == 'rnn'):
+		if (D is None):
+			self.NNG_ = NNG = self._approx_nng(X, self.nn_method, self.nn_param)
+			if (self.nn_method == 'rnn' and NNG.nonzero()[0].shape[0] <= 2): self.NNG_ = NNG = self._approx_nng(X, 'knn', 4)
+		elif (self.tile_size is not None):
+			self.NNG_ = NNG = dstclc.tiled_nng(D, nn_method=self.nn_method, nn_param=self.nn_param, tile_size=self.tile_size)
+			if (self.nn_method == 'rnn' and NNG.nonzero()[0].shape[0] <= 2): self.NNG_ = NNG = dstclc.tiled_nng(D, nn_method='knn', nn_param=4, tile_size=self.tile_size)
+		elif (self.nn_method == 'rnn'):
 			self.NNG_ = NNG = radius_neighbors_graph(D, self.nn_param, mode='distance', metric='precomputed', n_jobs=self.n_jobs)
 			if (NNG.nonzero()[0].shape[0] <= 2): self.NNG_ = NNG = kneighbors_graph(D, 4, mode='distance', metric='precomputed', n_jobs=self.n_jobs)
 		else:
@@ -183,53 +192,67 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 			raise ValueError("Incorrect number of features. Got %d features, expected %d" % (n_features, expected_n_features))
 		return X
 		
-	def _bicut_val(self, g, a, b):
-		return sum([g[i, j] for i, j in product(a, b)])
+	def _approx_nng(self, X, nn_method, nn_param):
+		# Sparse document vectors with a set-based or cosine metric only need the sparse products
+		if (issparse(X) and self.metric in dstclc.SPARSE_METRICS):
+			return dstclc.sparse_nng(X, nn_method=nn_method, nn_param=nn_param, metric=self.metric)
+		return dstclc.approx_nng(X, nn_method=nn_method, nn_param=nn_param, metric=self.metric, random_state=0)
+		
+	def _clt_mt(self, n, clusters):
+		# Sparse cluster membership matrix M of shape [n_vertices, n_clusters]
+		clt_arrays = [np.unique(np.array(list(clt), dtype='int64')) for clt in clusters]
+		rows = np.concatenate(clt_arrays + [np.array([], dtype='int64')])
+		cols = np.arange(len(clt_arrays)).repeat([clt.shape[0] for clt in clt_arrays])
+		return csr_matrix((np.ones(rows.shape[0]), (rows, cols)), shape=(n, len(clt_arrays)))
+		
+	def _cut_vec(self, g, M):
+		# Edge cut 1_c^T G 1_{V-c} = 1_c^T G 1 - 1_c^T G 1_c and the row volume 1_c^T G 1 of every cluster at once
+		g = csr_matrix(g)
+		vol = np.asarray(M.T.dot(np.asarray(g.sum(axis=1)).ravel())).ravel()
+		inner = np.asarray(M.multiply(g.dot(M)).sum(axis=0)).ravel()
+		return vol - inner, vol
 		
 	def _cut_val(self, g, clusters, method='mincut'):
-		vset = set(range(g.shape[0]))
-		if (all(isinstance(clt, set) for clt in clusters)):
-			clt_sets = clusters
-		else:
-			clt_sets = [set(clt) for clt in clusters]
-		cmp_clt_sets = [vset - clt for clt in clt_sets]
-		# print clt_sets
-		# print cmp_clt_sets
+		M = self._clt_mt(g.shape[0], clusters)
+		cut, vol = self._cut_vec(g, M)
 		if (method == 'normcut'):
-			return 0.5 * sum([self._bicut_val(g, clt, cmpclt) / (g[list(clt),:].sum() - g.diagonal()[list(clt)].sum()) for clt, cmpclt in zip(clt_sets, cmp_clt_sets)])
+			return 0.5 * (cut / (vol - M.T.dot(g.diagonal()))).sum()
 		elif (method == 'ratiocut'):
-			return 0.5 * sum([self._bicut_val(g, clt, cmpclt) / len(clt) for clt, cmpclt in zip(clt_sets, cmp_clt_sets)])
+			return 0.5 * (cut / np.asarray(M.sum(axis=0)).ravel()).sum()
 		else:
-			return 0.5 * sum([self._bicut_val(g, clt, cmpclt) for clt, cmpclt in zip(clt_sets, cmp_clt_sets)])
+			return 0.5 * cut.sum()
 			
 	def _rirc(self, g, clusters):
 		clt_num = len(clusters)
-		clt_arrays = [np.array(list(clt)) for clt in clusters]
-		clt_sets = [set(clt) for clt in clusters]
-		clt_size = [len(clt) for clt in clt_sets]
+		M = self._clt_mt(g.shape[0], clusters)
+		clt_size = np.asarray(M.sum(axis=0)).ravel()
+		# Only the rows of the clustered vertices are involved
+		rows = np.unique(M.nonzero()[0])
+		sub_g, sub_M = csr_matrix(g)[rows,:], M[rows,:]
+		sub_g.sum_duplicates()
+		sub_g.eliminate_zeros()
+		sub_p = csr_matrix((np.ones_like(sub_g.data), sub_g.indices, sub_g.indptr), shape=sub_g.shape)
+		# Inter-cluster edge weights 1_i^T G 1_j and edge numbers of all the cluster pairs
+		ew_mt, en_mt = sub_M.T.dot(sub_g.dot(M)).toarray(), sub_M.T.dot(sub_p.dot(M)).toarray()
 		# Calculate edge cut
-		edge_cut = [self._cut_val(g, [clt], method='mincut') for clt in clt_sets]
-		mutual_edge_cut = {}
+		edge_cut = 0.5 * (np.asarray(sub_M.T.dot(np.asarray(sub_g.sum(axis=1)).ravel())).ravel() - ew_mt.diagonal())
+		bicut_edge_num = np.asarray(sub_M.T.dot(np.diff(sub_p.indptr))).ravel()
+		iu, ju = np.triu_indices(clt_num, 1)
+		mec = 0.5 * ew_mt[iu, ju]
+		mutual_edge_cut = dict(zip(zip(iu, ju), mec))
+		ec_i, ec_j, men = edge_cut[iu], edge_cut[ju], en_mt[iu, ju]
+		union_clt_size = clt_size[iu] + clt_size[ju]
 		ri, rc = np.zeros((clt_num, clt_num), dtype=np.float16), np.zeros((clt_num, clt_num), dtype=np.float16)
-		for i, j in combinations(range(clt_num), 2):
-			# print clt_sets[i], clt_sets[j]
-			union_clt = np.array(list(clt_sets[i]) + list(clt_sets[j]))
-			union_clt_size = clt_size[i] + clt_size[j]
-			sub_graph = g[union_clt,:][:,union_clt]
-			mutual_edge_cut[(i,j)] = self._cut_val(sub_graph, [range(clt_size[i])], method='mincut')
+		with np.errstate(divide='ignore', invalid='ignore'):
 			# Relative inter-connectivity
-			if (edge_cut[i] == 0 or edge_cut[j] == 0):
-				ri[i, j] = ri[j, i] = rc[i, j] = rc[j, i] = 0
-				continue
-			ri[i, j] = ri[j, i] = 2.0 * abs(mutual_edge_cut[(i,j)]) / (abs(edge_cut[i]) + abs(edge_cut[j]))
+			valid = np.logical_and(ec_i != 0, ec_j != 0)
+			ri_val = np.where(valid, 2.0 * np.abs(mec) / (np.abs(ec_i) + np.abs(ec_j)), 0)
 			# Relative closeness
-			mutual_edge_num = find(sub_graph[range(clt_size[i]),:][:,range(clt_size[i],union_clt_size)])[0].shape[0]
-			bicut_edge_num = find(g[clt_arrays[i],:])[0].shape[0], find(g[clt_arrays[j],:])[0].shape[0]
-			if (mutual_edge_num == 0 or bicut_edge_num[0] == 0 or bicut_edge_num[1] == 0):
-				rc[i, j] = rc[j, i] = 0
-			else:
-				rc[i, j] = rc[j, i] = (mutual_edge_cut[(i,j)] / mutual_edge_num) / (1.0 * clt_size[i] / union_clt_size * edge_cut[i] / bicut_edge_num[0] + 1.0 * clt_size[j] / union_clt_size * edge_cut[j] / bicut_edge_num[1])
-		return ri * rc ** self.rcexp, edge_cut, mutual_edge_cut
+			valid = valid & (men != 0) & (bicut_edge_num[iu] != 0) & (bicut_edge_num[ju] != 0)
+			rc_val = np.where(valid, (mec / men) / (1.0 * clt_size[iu] / union_clt_size * ec_i / bicut_edge_num[iu] + 1.0 * clt_size[ju] / union_clt_size * ec_j / bicut_edge_num[ju]), 0)
+		ri[iu, ju] = ri[ju, iu] = ri_val
+		rc[iu, ju] = rc[ju, iu] = rc_val
+		return ri * rc ** self.rcexp, edge_cut.tolist(), mutual_edge_cut
 		
 	def _node_pair_gen(self, leaf_sets, g=[], leaf_clt=[]):
 		leaf_ids = [x['id'] for x in leaf_sets]
@@ -273,10 +296,30 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 		clusters.extend([node.value])
 		return clusters
 		
-	def _conductance(self, g, vset, clt):
-		clt_array, cmp_clt_array = np.array(clt), np.array(list(vset - set(clt)))
-		edge_cut = self._cut_val(g, [clt], method='mincut')
-		e_sum, cmpe_sum = g[clt_array,:][:,clt_array].sum(), g[cmp_clt_array,:][:,cmp_clt_array].sum()
+	def _graph_stat(self, g):
+		g = csr_matrix(g)
+		return dict(g=g, out_deg=np.asarray(g.sum(axis=1)).ravel(), in_deg=np.asarray(g.sum(axis=0)).ravel(), total=g.sum())
+		
+	def _clt_stat(self, g_stat, clusters):
+		# Out-volume, in-volume and inner edge weight of each cluster
+		g, M = g_stat['g'], self._clt_mt(g_stat['g'].shape[0], clusters)
+		out_vol, in_vol = M.T.dot(g_stat['out_deg']), M.T.dot(g_stat['in_deg'])
+		inner_ew = np.asarray(M.multiply(g.dot(M)).sum(axis=0)).ravel()
+		return zip(out_vol, in_vol, inner_ew)
+		
+	def _merge_stat(self, g_stat, a, b, a_stat, b_stat):
+		# Only the edges that start from the two clusters are visited
+		a, b = np.array(list(a)), np.array(list(b))
+		a_sub, b_sub = g_stat['g'][a,:], g_stat['g'][b,:]
+		mutual_ew = a_sub.data[np.in1d(a_sub.indices, b)].sum() + b_sub.data[np.in1d(b_sub.indices, a)].sum()
+		return a_stat[0] + b_stat[0], a_stat[1] + b_stat[1], a_stat[2] + b_stat[2] + mutual_ew
+		
+	def _conductance(self, g_stat, clt_stat):
+		out_vol, in_vol, e_sum = clt_stat
+		edge_cut = 0.5 * (out_vol - e_sum)
+		cmpe_sum = g_stat['total'] - out_vol - in_vol + e_sum
+		# The residual of the subtraction means that there is no edge within the complement
+		if (abs(cmpe_sum) <= 1e-9 * abs(g_stat['total'])): cmpe_sum = 0
 		if (e_sum == 0):
 			if (cmpe_sum == 0):
 				return 0
@@ -286,12 +329,12 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 			return 2.0 * edge_cut / e_sum
 		return 2.0 * edge_cut / min(e_sum, cmpe_sum)
 		
-	def _cross_merge(self, node, g, vset):
+	def _cross_merge(self, node, g_stat, clt_stats):
 		merged_nodes = []
 		if (node.left != None):
-			merged_nodes.extend(self._cross_merge(node.left, g, vset))
+			merged_nodes.extend(self._cross_merge(node.left, g_stat, clt_stats))
 		if (node.right != None):
-			merged_nodes.extend(self._cross_merge(node.right, g, vset))
+			merged_nodes.extend(self._cross_merge(node.right, g_stat, clt_stats))
 		if (not self.merge_all and (node.left != None or node.right != None)):
 			return merged_nodes
 		parent = node.parent
@@ -304,8 +347,8 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 				if (not self.merge_all and (cand_node.left != None or cand_node.right != None)):
 					continue
 				merged_clt = node.data['clt'] + cand_node.data['clt']
-				cond = self._conductance(g, vset, merged_clt)
-				rirc = 0.5 * self._rirc(g, [node.data['clt'], cand_node.data['clt']])[0].sum()
+				cond = self._conductance(g_stat, self._merge_stat(g_stat, node.data['clt'], cand_node.data['clt'], clt_stats[node.data['id']], clt_stats[cand_node.data['id']]))
+				rirc = 0.5 * self._rirc(g_stat['g'], [node.data['clt'], cand_node.data['clt']])[0].sum()
 				insert_pnode = cand_node.parent if ((id_order == 'bottom_up' and cand_node.data['id'] > node.data['id']) or (id_order == 'top_down' and cand_node.data['id'] < node.data['id'])) else node.parent
 				if (cond > insert_pnode.data['cond'] and rirc > 0.1):
 					# print cond, rirc, merged_clt
@@ -315,6 +358,57 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 			parent = parent.parent
 		return merged_nodes
 
+	def _mst_sweep(self, sorted_row, sorted_col, sorted_data, cut_thrshds, vnum):
+		edge_num, step_num = sorted_data.shape[0], cut_thrshds.shape[0]
+		if (step_num == 0): return np.ones(edge_num, dtype='bool'), {}
+		# Find out the step at which each edge is cut, the edges that connect to the leaves are preserved
+		ecut_step, degree, cut_idx = np.full(edge_num, step_num, dtype='int64'), np.bincount(np.append(sorted_row, sorted_col), minlength=vnum), edge_num
+		for step, cut_thrshd in enumerate(cut_thrshds):
+			new_cut_idx = np.searchsorted(sorted_data[:cut_idx], cut_thrshd)
+			cut_mask = np.logical_and(degree[sorted_row[new_cut_idx:cut_idx]] != 1, degree[sorted_col[new_cut_idx:cut_idx]] != 1)
+			cut_eidx = np.arange(new_cut_idx, cut_idx)[cut_mask]
+			ecut_step[cut_eidx] = step
+			degree -= np.bincount(np.append(sorted_row[cut_eidx], sorted_col[cut_eidx]), minlength=vnum)
+			cut_idx = new_cut_idx
+		# Add the edges back in the reverse order of the sweep (Kruskal) with union-find
+		rows, cols = sorted_row.tolist(), sorted_col.tolist()
+		parent, members, last_step = range(vnum), [[v] for v in xrange(vnum)], [step_num - 1] * vnum
+		def find_root(v):
+			while (parent[v] != v):
+				parent[v] = parent[parent[v]]
+				v = parent[v]
+			return v
+		def union(u, v, step):
+			ru, rv = find_root(u), find_root(v)
+			if (ru == rv): return
+			if (len(members[ru]) < len(members[rv])): ru, rv = rv, ru
+			parent[rv] = ru
+			members[ru].extend(members[rv])
+			members[rv] = None
+			# The merged cluster exists until the step before the cut
+			last_step[ru] = step - 1
+		eorder = ecut_step.argsort(kind='mergesort')
+		bounds = np.searchsorted(ecut_step[eorder], np.arange(step_num + 2))
+		for e in eorder[bounds[step_num]:bounds[step_num + 1]]:
+			union(rows[e], cols[e], step_num)
+		# The clusters split out at each step
+		new_clts = []
+		for step in xrange(step_num - 1, -1, -1):
+			eidx = eorder[bounds[step]:bounds[step + 1]]
+			roots = set([find_root(v) for e in eidx for v in (rows[e], cols[e])])
+			new_clts.append((step, [(last_step[r], tuple(sorted(members[r]))) for r in roots if len(members[r]) > 1]))
+			for e in eidx:
+				union(rows[e], cols[e], step)
+		# The clusters that already exist before the sweep and remain after the first cut
+		init_clts = [(last_step[r], tuple(sorted(members[r]))) for r in xrange(vnum) if parent[r] == r and last_step[r] >= 0 and len(members[r]) > 1]
+		new_clts.reverse()
+		# Stop at the step where enough hierarchical clusters are found
+		clt_cnt = np.cumsum([len(clts) for step, clts in new_clts])
+		clt_cnt += len(init_clts)
+		stop_step = min(np.searchsorted(clt_cnt, 2 * self.max_cltnum), step_num - 1)
+		hrc_clusters = dict([(clt, cut_thrshds[min(lstep, stop_step)]) for lstep, clt in init_clts + func.flatten_list([clts for step, clts in new_clts[:stop_step + 1]])])
+		return ecut_step > stop_step, hrc_clusters
+
 	def _mst_cut(self, NNG):
 		## Build the minimum spanning tree
 		self.MST_ = MST = minimum_spanning_tree(NNG)
@@ -326,50 +420,34 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 		# plot.plot_hist(sorted_data, 'Edge Weight (Distance)', 'Number', fit_line=True, title='Histogram of Edge Weight (Distance)', fname='ew_hist')
 		# plot.plot_hist(sorted_data, 'Edge Weight (Distance)', 'Number', cumulative=True, fit_line=True, title='Histogram of Edge Weight (Distance)', fname='cew_hist')
 		## Find the cut threshold according to the distribution of the weight/distance, linspace: uniform distribution
-		cut_idx, g, presrv_e, hrc_clusters = sorted_data.shape[0], coo_MST, dict(row=np.array([], dtype=np.int64), col=np.array([], dtype=np.int64), data=np.array([], dtype=np.float64)), {}
 		hist, bin_edges = np.histogram(sorted_data, bins='rice')
 		weird_val_idx = len(hist) - 1 - np.abs(hist[-1:0:-1] - hist[-2::-1]).argmax()
 		cut_val = sorted_data[np.searchsorted(sorted_data, (bin_edges[weird_val_idx] + bin_edges[weird_val_idx + 1]) / 2)]
-		for cut_thrshd in np.linspace(cut_val, bin_edges[weird_val_idx], num=(cut_val-bin_edges[weird_val_idx])/self.cut_step, endpoint=False):
-			# print cut_thrshd
-			# Find out the edges that connect to the leaves
-			out_degree, in_degree = Counter(np.append(sorted_row[:cut_idx], presrv_e['row'])), Counter(np.append(sorted_col[:cut_idx], presrv_e['col']))
-			degree_sum = out_degree + in_degree
-			leaves = [x for x in degree_sum.keys() if degree_sum[x] == 1]
-			# Search the cut index
-			new_cut_idx = np.searchsorted(sorted_data[:cut_idx], cut_thrshd)
-			# Update the preserved edges
-			preserved_mask = np.array([True if u in leaves or v in leaves else False for u, v in zip(sorted_row[new_cut_idx:cut_idx], sorted_col[new_cut_idx:cut_idx])])
-			if (preserved_mask.shape[0] > 0):
-				presrv_e = dict(row=np.append(presrv_e['row'], sorted_row[new_cut_idx:cut_idx][preserved_mask]), col=np.append(presrv_e['col'], sorted_col[new_cut_idx:cut_idx][preserved_mask]), data=np.append(presrv_e['data'], sorted_data[new_cut_idx:cut_idx][preserved_mask]))
-			cut_idx = new_cut_idx
-			# Build a new graph
-			g = coo_matrix((np.append(sorted_data[:cut_idx], presrv_e['data']), (np.append(sorted_row[:cut_idx], presrv_e['row']), np.append(sorted_col[:cut_idx], presrv_e['col']))), shape=g.shape)
-			# Find out the clusters
-			clt_num, clt_lbs = connected_components(g)
-			clts = [tuple(np.where(clt_lbs==x)[0]) for x in np.unique(clt_lbs)]
-			# Update the clusters
-			hrc_clusters.update(dict([(clt, cut_thrshd) for clt in clts if len(clt) > 1 and (clt, cut_thrshd) not in hrc_clusters]))
-			if (len(hrc_clusters) >= 2 * self.max_cltnum):
-				break
+		cut_thrshds = np.linspace(cut_val, bin_edges[weird_val_idx], num=(cut_val-bin_edges[weird_val_idx])/self.cut_step, endpoint=False)
+		presrv_mask, hrc_clusters = self._mst_sweep(sorted_row, sorted_col, sorted_data, cut_thrshds, coo_MST.shape[0])
+		# Build the graph that remains after the sweep
+		g = coo_matrix((sorted_data[presrv_mask], (sorted_row[presrv_mask], sorted_col[presrv_mask])), shape=coo_MST.shape)
 		# minor_clusters = hrc_clusters
 		## Find the inconsistent edge weight/distance
-		dok_MST, csr_MST, csc_MST = g.todok(), g.tocsr(), g.tocsc()
-		rowcol_ew = [np.append(dok_MST.getrow(i).toarray().reshape((dok_MST.shape[0],)), dok_MST.getcol(i).toarray().reshape((dok_MST.shape[0],))) for i in range(dok_MST.shape[0])]
-		rowcol_ewp = [x[x>0] for x in rowcol_ew]
-		minimum_ew = [x.min() if x.shape[0] > 0 else 0 for x in rowcol_ewp]
+		g = g.tocsr().tocoo()
+		# Minimum positive edge weight incident to each node, computed over the edges grouped by node
+		nodes, ews = np.append(g.row, g.col), np.append(g.data, g.data)
+		nodes, ews = nodes[ews > 0], ews[ews > 0]
+		node_order = nodes.argsort(kind='mergesort')
+		nodes, ews = nodes[node_order], ews[node_order]
+		minimum_ew = np.zeros(g.shape[0])
+		if (nodes.shape[0] > 0):
+			grp_starts = np.flatnonzero(np.append(True, nodes[1:] != nodes[:-1]))
+			minimum_ew[nodes[grp_starts]] = np.minimum.reduceat(ews, grp_starts)
 		# print minimum_ew
-		for i in xrange(dok_MST.shape[0]):
-			for j in xrange(csr_MST.indptr[i], csr_MST.indptr[i+1]):
-				col = csr_MST.indices[j]
-				if ((dok_MST[i,col] - minimum_ew[i]) / minimum_ew[i] > self.coarse and minimum_ew[col] < dok_MST[i,col]):
-					dok_MST[i, col] = 0
-			for j in xrange(csc_MST.indptr[i], csc_MST.indptr[i+1]):
-				row = csc_MST.indices[j]
-				if ((dok_MST[row,i] - minimum_ew[i]) / minimum_ew[i] > self.coarse and minimum_ew[row] < dok_MST[row,i]):
-					dok_MST[row,i] = 0
+		# Prune the edges that are inconsistent with the minimum edge weight of either endpoint
+		with np.errstate(divide='ignore', invalid='ignore'):
+			row_min, col_min = minimum_ew[g.row], minimum_ew[g.col]
+			incnst_mask = np.logical_or(np.logical_and((g.data - row_min) / row_min > self.coarse, col_min < g.data), np.logical_and((g.data - col_min) / col_min > self.coarse, row_min < g.data))
+		cnst_mask = ~incnst_mask
+		pruned_MST = coo_matrix((g.data[cnst_mask], (g.row[cnst_mask], g.col[cnst_mask])), shape=g.shape)
 		# Find out the clusters
-		clt_num, clt_lbs = connected_components(dok_MST)
+		clt_num, clt_lbs = connected_components(pruned_MST)
 		clts = [tuple(np.where(clt_lbs==x)[0]) for x in np.unique(clt_lbs)]
 		minor_clusters = dict([(clt, 0) for clt in clts if len(clt) > 1])
 		self.minor_clts_ = minor_clts = minor_clusters.keys()
@@ -388,13 +466,15 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 		num_comp, comp_lbs = connected_components(conn)
 		self.aggl_clt_ = aggl_clt = AgglomerativeClustering(connectivity=conn, affinity='precomputed' if num_comp==1 else 'euclidean', memory='/dev/shm', linkage='complete')
 		aggl_clt.fit(dist_rirc)
-		vset, all_clts, cand_clts, all_conds, conds, filtered = set(range(SIM_NNG.shape[0])), minor_clts[:], minor_clts[:], [10]*len(minor_clts), [10]*len(minor_clts), [False for x in minor_clts]
+		all_clts, cand_clts, all_conds, conds, filtered = minor_clts[:], minor_clts[:], [10]*len(minor_clts), [10]*len(minor_clts), [False for x in minor_clts]
+		# Cache the degrees of the similarity graph and update the cluster statistics incrementally as clusters merge
+		g_stat = self._graph_stat(SIM_NNG)
+		all_stats = self._clt_stat(g_stat, minor_clts)
 		for l, r in aggl_clt.children_:
 			merged_clt = all_clts[l] + all_clts[r]
-			# clt_array, cmp_clt_array = np.array(merged_clt), np.array(list(vset - set(merged_clt)))
-			edge_cut = self._cut_val(SIM_NNG, [merged_clt], method='mincut')
+			merged_stat = self._merge_stat(g_stat, all_clts[l], all_clts[r], all_stats[l], all_stats[r])
 			# Calculate the conductance of each merged cluster to help determine whether it should be kept
-			conductance = self._conductance(SIM_NNG, vset, merged_clt)
+			conductance = self._conductance(g_stat, merged_stat)
 			if (conductance > self.cond):
 				cand_clts.append(merged_clt)
 				conds.append(conductance)
@@ -402,6 +482,7 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 			else:
 				filtered.append(True)
 			all_clts.append(merged_clt)
+			all_stats.append(merged_stat)
 			all_conds.append(conductance)
 		## Save the hierarchical tree
 		children_list = [[]] * len(minor_clts) + aggl_clt.children_.tolist()
@@ -420,7 +501,7 @@ class Kallima(BaseEstimator, ClusterMixin, TransformerMixin):
 		io.write_obj(clt_tree, '%s_hrc_tree.pkl' % self.mdl_name)
 		## Cross merge clusters over the hierarchical tree
 		if (self.cross_merge):
-			merged_nodes = self._cross_merge(clt_tree, SIM_NNG, vset)
+			merged_nodes = self._cross_merge(clt_tree, g_stat, all_stats)
 			mn_dict = dict([(tuple(set(k)), v) for k, v in merged_nodes])
 			if (len(mn_dict) > 0):
 				merged_clts, merged_conds = zip(*[(mn['clt'], mn['cond']) for mn in mn_dict.values()])
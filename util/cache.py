@@ -11,6 +11,16 @@
 
 import os
 import json
+import glob
+import hashlib
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+
+logger = logging.getLogger(__name__)
 
 
 def mmc_json_srlz(key, value):
@@ -23,4 +33,106 @@ def mmc_json_desrlz(key, value, flags):
 		return value
 	if (flags == 2):
 		return json.loads(value)
-	raise Exception("Unknown serialization format")
\ No newline at end of file
+	raise Exception("Unknown serialization format")
+		
+		
+def mt_digest(*mts):
+	# Content hash of the (sparse) matrices, used as the key of the in-memory cache
+	h = hashlib.sha1()
+	for mt in mts:
+		if (mt is None):
+			h.update('None')
+			continue
+		if (sparse.issparse(mt)):
+			mt = mt.tocsr()
+			arrays = [mt.data, mt.indices, mt.indptr]
+		else:
+			arrays = [np.asarray(mt)]
+		h.update('%s%s' % (type(mt).__name__, mt.shape))
+		for a in arrays:
+			h.update(str(a.dtype))
+			h.update(np.ascontiguousarray(a).view(np.uint8))
+	return h.hexdigest()
+	
+	
+def _nbytes(value):
+	if (isinstance(value, (tuple, list))):
+		return sum([_nbytes(x) for x in value])
+	return getattr(value, 'nbytes', 0)
+	
+	
+class LRUCache(object):
+	def __init__(self, max_bytes=512*1024**2):
+		self.max_bytes = max_bytes
+		self.nbytes = 0
+		self._data = OrderedDict()
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def get(self, key, default=None):
+		if (key not in self._data):
+			return default
+		value, nbytes = self._data.pop(key)
+		self._data[key] = (value, nbytes)
+		return value
+
+	def set(self, key, value):
+		if (key in self._data):
+			self.nbytes -= self._data.pop(key)[1]
+		nbytes = _nbytes(value)
+		if (nbytes > self.max_bytes):
+			return
+		while (self.nbytes + nbytes > self.max_bytes and len(self._data) > 0):
+			self.nbytes -= self._data.popitem(last=False)[1][1]
+		self._data[key] = (value, nbytes)
+		self.nbytes += nbytes
+
+	def clear(self):
+		self._data.clear()
+		self.nbytes = 0
+		
+		
+class MmapCache(object):
+	def __init__(self, cache_dir, max_bytes=8*1024**3, dtype='float32', block_size=4096):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		self.dtype = dtype
+		self.block_size = block_size
+		if (not os.path.exists(cache_dir)): os.makedirs(cache_dir)
+
+	def _fpath(self, key):
+		return os.path.join(self.cache_dir, '%s.npy' % key)
+
+	def get(self, key):
+		fpath = self._fpath(key)
+		if (not os.path.exists(fpath)):
+			logger.info('Cache miss: %s' % key)
+			return None
+		# The modification time records the last use for the eviction
+		os.utime(fpath, None)
+		logger.info('Cache hit: %s' % key)
+		return np.load(fpath, mmap_mode='r')
+
+	def set(self, key, value):
+		fpath = self._fpath(key)
+		tmp_fpath = '%s.%i.tmp' % (fpath, os.getpid())
+		# Copy block by block so that a memory-mapped input is never loaded at once
+		mt = np.lib.format.open_memmap(tmp_fpath, mode='w+', dtype=self.dtype, shape=value.shape)
+		for start in xrange(0, value.shape[0], self.block_size):
+			mt[start:start + self.block_size] = value[start:start + self.block_size]
+		mt.flush()
+		del mt
+		os.rename(tmp_fpath, fpath)
+		self.evict(keep=fpath)
+		return np.load(fpath, mmap_mode='r')
+
+	def evict(self, keep=None):
+		fpaths = sorted(glob.glob(os.path.join(self.cache_dir, '*.npy')), key=os.path.getmtime)
+		total_size = sum([os.path.getsize(fpath) for fpath in fpaths])
+		for fpath in fpaths:
+			if (total_size <= self.max_bytes): break
+			if (fpath == keep): continue
+			total_size -= os.path.getsize(fpath)
+			os.remove(fpath)
+			logger.info('Cache evicted: %s' % os.path.splitext(os.path.basename(fpath))[0])
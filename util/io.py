@@ -85,11 +85,15 @@ def write_spmt(mt, fpath, sparse_fmt='csr', compress=False):
 		
 def read_spmt(fpath, sparse_fmt='csr'):
 	npzfile = read_npz(fpath)
-	if (sparse_fmt == 'csc'):
+	# The stored layout follows from the length of indptr, sparse_fmt only decides for the square matrices
+	shape, indptr_len, stored_fmt = tuple(npzfile['shape']), npzfile['indptr'].shape[0], sparse_fmt
+	if (shape[0] != shape[1] and indptr_len in (shape[0] + 1, shape[1] + 1)):
+		stored_fmt = 'csr' if indptr_len == shape[0] + 1 else 'csc'
+	if (stored_fmt == 'csc'):
 		mt = sparse.csc_matrix((npzfile['data'], npzfile['indices'], npzfile['indptr']), shape=npzfile['shape'])
 	else:
 		mt = sparse.csr_matrix((npzfile['data'], npzfile['indices'], npzfile['indptr']), shape=npzfile['shape'])
-	return mt
+	return mt.asformat('csc' if sparse_fmt == 'csc' else 'csr')
 
 
 def write_df(df, fpath, with_col=True, with_idx=False, sparse_fmt=None, compress=False):
@@ -120,6 +124,13 @@ def read_df(fpath, with_col=True, with_idx=False, sparse_fmt=None):
 	return pd.DataFrame(data=mt, index=npzfile['idx'] if with_idx and len(npzfile['idx'].shape) == 1 else None, columns=npzfile['col'] if len(npzfile['col'].shape) == 1 else None)
 	
 	
+def read_df_col(fpath):
+	# Only load the column names, the npz members are read lazily
+	npzfile = read_npz(fpath)
+	col = npzfile['col']
+	return col if len(col.shape) == 1 else None
+	
+	
 def write_spdf(df, fpath, with_col=True, with_idx=False, sparse_fmt=None, compress=False):
 	fs.mkdir(os.path.dirname(fpath))
 	fpath = os.path.splitext(fpath)[0] + '.npz'
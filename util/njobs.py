@@ -9,10 +9,14 @@
 ###########################################################################
 #
 
+import os
 import time
-from multiprocessing import Process, Pool
+import shutil
+import tempfile
+from multiprocessing import Process, Pool, cpu_count
 
 import numpy as np
+from scipy import sparse
 
 
 def split_1d(task_num, split_num=None, task_size=None, split_size=None):
@@ -52,6 +56,42 @@ def split_2d(task_grid, split_num=None, task_size=None, split_size=None):
 		return [split_1d(task_grid[0], split_num=grid[0]), split_1d(task_grid[1], split_num=grid[1])]
 		
 
+def cpu_jobs(n_jobs):
+	return max(cpu_count() + 1 + n_jobs, 1) if n_jobs < 0 else n_jobs
+	
+	
+def split_slices(task_num, split_num=None, task_size=None, split_size=None):
+	bounds = np.cumsum([0] + split_1d(task_num, split_num=split_num, task_size=task_size, split_size=split_size))
+	return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+	
+	
+def dump_shared(mt, fmt=None, dir=None):
+	# Dump the (sparse) matrix into memory-mapped files so that the worker processes share it instead of unpickling their own copies
+	if (dir is None and os.path.isdir('/dev/shm')): dir = '/dev/shm'
+	fpath = tempfile.mkdtemp(prefix='njobs_', dir=dir)
+	if (sparse.issparse(mt)):
+		mt = mt.asformat(fmt) if fmt is not None else mt
+		if (mt.format not in ['csr', 'csc']): mt = mt.tocsr()
+		for k in ['data', 'indices', 'indptr']:
+			np.save(os.path.join(fpath, '%s.npy' % k), getattr(mt, k))
+		return dict(path=fpath, format=mt.format, shape=mt.shape)
+	np.save(os.path.join(fpath, 'data.npy'), np.asarray(mt))
+	return dict(path=fpath, format=None, shape=mt.shape)
+	
+	
+def load_shared(handle, mode='r'):
+	data = np.load(os.path.join(handle['path'], 'data.npy'), mmap_mode=mode)
+	if (handle['format'] is None):
+		return data
+	indices, indptr = [np.load(os.path.join(handle['path'], '%s.npy' % k), mmap_mode=mode) for k in ['indices', 'indptr']]
+	mt_cls = sparse.csc_matrix if handle['format'] == 'csc' else sparse.csr_matrix
+	return mt_cls((data, indices, indptr), shape=handle['shape'], copy=False)
+	
+	
+def free_shared(handle):
+	shutil.rmtree(handle['path'], ignore_errors=True)
+	
+
 def run(target, **kwargs):
 	p = Process(target=target, kwargs=kwargs)
 	p.start()